@@ -1,9 +1,20 @@
-import json
+import csv
+import hashlib
+import io
+import math
 import sqlite3
 import os
-import pandas as pd
-from flask import Flask, render_template, request, redirect, jsonify, send_file
-from datetime import datetime
+import queue
+import shutil
+import tempfile
+import time
+import click
+import numpy as np
+import orjson
+import xlsxwriter
+from flask import Flask, render_template, request, redirect, jsonify, send_file, g
+from datetime import datetime, timedelta
+from pathlib import Path
 from werkzeug.utils import secure_filename
 
 app = Flask(__name__)
@@ -12,299 +23,708 @@ UPLOAD_FOLDER = "static/uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 
+@app.after_request
+def cache_uploads(resp):
+    # Uploaded images never change once written, so let browsers keep them.
+    # In production the reverse proxy should serve /static/ directly.
+    if request.path.startswith("/static/uploads/") and resp.status_code == 200:
+        resp.headers["Cache-Control"] = "public, max-age=604800, immutable"
+    return resp
+
 # ---------- DATABASE ----------
 DB_PATH = "power.db"
 
+def _apply_pragmas(c):
+    # Per-connection settings; journal_mode=WAL is persistent and set in init_db()
+    c.execute("PRAGMA synchronous=NORMAL")
+    c.execute("PRAGMA temp_store=MEMORY")
+    c.execute("PRAGMA mmap_size=268435456")
+    c.execute("PRAGMA cache_size=-50000")
+    c.execute("PRAGMA foreign_keys=ON")
+
+# Idle connections kept per worker process. Requests check one out and hand
+# it back in teardown, so the page and statement caches outlive any one
+# request whether the worker runs threads or greenlets.
+POOL_SIZE = 8
+_pools = {"c": queue.LifoQueue(POOL_SIZE), "ro": queue.LifoQueue(POOL_SIZE)}
+
+def _connect(target, **kwargs):
+    # Every query is a fixed, parameterised string, so a larger statement
+    # cache lets the long-lived connection skip re-preparing them
+    c = sqlite3.connect(target, check_same_thread=False, isolation_level=None,
+                        cached_statements=256, **kwargs)
+    c.row_factory = sqlite3.Row
+    _apply_pragmas(c)
+    return c
+
+def _open(kind):
+    if kind == "ro":
+        return _connect(Path(DB_PATH).resolve().as_uri() + "?mode=ro", uri=True)
+    return _connect(DB_PATH)
+
+def _checkout(kind):
+    # At most one connection of each kind per request, kept on flask.g
+    c = g.get("db_" + kind)
+    if c is None:
+        try:
+            c = _pools[kind].get_nowait()
+        except queue.Empty:
+            c = _open(kind)
+        setattr(g, "db_" + kind, c)
+    return c
+
+def _checkin(kind, c):
+    try:
+        _pools[kind].put_nowait(c)
+    except queue.Full:
+        c.close()
+
 def db():
-    # Use check_same_thread=False for SQLite in Flask
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+    # isolation_level=None means we BEGIN/COMMIT ourselves
+    return _checkout("c")
+
+def db_ro():
+    # Read-only companion to db() for views that never write: it can never
+    # take the write lock and SQLite skips write bookkeeping for it
+    return _checkout("ro")
+
+@app.teardown_appcontext
+def release_db(exc):
+    # Drop any transaction an error left open, then return the connections
+    for kind in _pools:
+        c = g.pop("db_" + kind, None)
+        if c is None:
+            continue
+        if c.in_transaction:
+            c.rollback()
+        _checkin(kind, c)
+
+# Shared by CREATE TABLE and _rebuild_table(); dates are stamped by SQLite
+ALERTS_SCHEMA = """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        meter_id TEXT,
+        date TEXT DEFAULT (strftime('%Y-%m-%d %H:%M','now','localtime')),
+        consumption REAL,
+        average REAL,
+        percentage REAL,
+        status TEXT,
+        acknowledged_by TEXT,
+        acknowledged_at TEXT,
+        closed_by TEXT,
+        closed_at TEXT,
+        reading_id INTEGER
+"""
+READINGS_SCHEMA = """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        meter_id TEXT,
+        date TEXT DEFAULT (strftime('%Y-%m-%d %H:%M','now','localtime')),
+        opening REAL,
+        closing REAL,
+        consumption REAL,
+        entered_by TEXT,
+        employee_id TEXT,
+        image TEXT
+"""
+
+def _rebuild_table(d, table, schema):
+    # SQLite cannot ALTER a column's DEFAULT, so copy into a fresh table.
+    # Dropping the old one also drops its triggers/indexes; init_db() recreates them.
+    old_cols = [r["name"] for r in d.execute(f"PRAGMA table_info({table})")]
+    d.execute(f"CREATE TABLE {table}_new ({schema})")
+    new_cols = [r["name"] for r in d.execute(f"PRAGMA table_info({table}_new)")]
+    cols = ",".join(c for c in old_cols if c in new_cols)
+    d.execute(f"INSERT INTO {table}_new ({cols}) SELECT {cols} FROM {table}")
+    d.execute(f"DROP TABLE {table}")
+    d.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+# Bump whenever init_db() changes the schema; databases already at this
+# version skip all DDL on startup
+SCHEMA_VERSION = 5
+
+def _enable_wal(d):
+    # WAL lets readers run alongside a writer and commits with one fsync.
+    # Several workers may try this at once; a locked switch is left to the
+    # worker that holds the lock and retried after the migration commits.
+    try:
+        d.execute("PRAGMA journal_mode=WAL")
+    except sqlite3.OperationalError:
+        pass
 
 def init_db():
-    with db() as d:
-        d.execute("""
-        CREATE TABLE IF NOT EXISTS alerts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            meter_id TEXT,
-            date TEXT,
-            consumption REAL,
-            average REAL,
-            percentage REAL,
-            status TEXT
-        )""")
-        d.execute("""
-        CREATE TABLE IF NOT EXISTS meters(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            meter_id TEXT UNIQUE,
-            load_type TEXT,
-            location TEXT,
-            unit TEXT
-        )""")
-        d.execute("""
-        CREATE TABLE IF NOT EXISTS readings(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            meter_id TEXT,
-            date TEXT,
-            opening REAL,
-            closing REAL,
-            consumption REAL,
-            entered_by TEXT,
-            employee_id TEXT,
-            image TEXT
-        )""")
+    # Runs at import, outside any request; the connection seeds the pool
+    d = _open("c")
+    try:
+        _upgrade(d)
+    finally:
+        _checkin("c", d)
+
+def _upgrade(d):
+    if d.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
+    _enable_wal(d)
+    # Workers booting together queue on the write lock instead of failing
+    # (a rebuild of a large table can take longer than the default 5s)
+    d.execute("PRAGMA busy_timeout=60000")
+    d.execute("BEGIN IMMEDIATE")
+    try:
+        # Another worker may have migrated while we waited for the lock
+        if d.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            d.rollback()
+            return
+        _migrate(d)
         d.commit()
+    finally:
+        if d.in_transaction:
+            d.rollback()
+        d.execute("PRAGMA busy_timeout=5000")
+    _enable_wal(d)
+
+def _migrate(d):
+    d.execute(f"CREATE TABLE IF NOT EXISTS alerts ({ALERTS_SCHEMA})")
+    d.execute("""
+    CREATE TABLE IF NOT EXISTS meters(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        meter_id TEXT UNIQUE,
+        load_type TEXT,
+        location TEXT,
+        unit TEXT
+    )""")
+    d.execute(f"CREATE TABLE IF NOT EXISTS readings ({READINGS_SCHEMA})")
+    # Databases created before the date defaults existed
+    for table, schema in (("alerts", ALERTS_SCHEMA), ("readings", READINGS_SCHEMA)):
+        date_col = [r for r in d.execute(f"PRAGMA table_info({table})") if r["name"] == "date"]
+        if date_col[0]["dflt_value"] is None:
+            _rebuild_table(d, table, schema)
+    # Alerts raised before they recorded their reading: link them to the
+    # latest reading of the same meter and consumption stamped no later than
+    # the alert (the two were stamped by separate clock reads, so their
+    # minutes can differ)
+    alert_cols = [r["name"] for r in d.execute("PRAGMA table_info(alerts)")]
+    if "reading_id" not in alert_cols:
+        d.execute("ALTER TABLE alerts ADD COLUMN reading_id INTEGER")
+    d.execute("""
+    UPDATE alerts SET reading_id = (
+        SELECT r.id FROM readings r
+        WHERE r.meter_id = alerts.meter_id AND r.date <= alerts.date
+          AND r.consumption = alerts.consumption
+        ORDER BY r.id DESC LIMIT 1
+    ) WHERE reading_id IS NULL""")
+    # Per-day consumption rollup, kept current by a trigger so the dashboard
+    # chart reads a handful of rows instead of grouping all readings
+    d.execute("""
+    CREATE TABLE IF NOT EXISTS readings_daily(
+        day TEXT PRIMARY KEY,
+        total REAL
+    )""")
+    # NULL consumption (SQLite stores NaN as NULL) must not turn a day's
+    # total into NULL, so the trigger treats it as 0. Older versions of the
+    # trigger did not, so rebuild the rollup from readings on every migration.
+    d.execute("DROP TRIGGER IF EXISTS trg_readings_ai")
+    d.execute("""
+    CREATE TRIGGER trg_readings_ai AFTER INSERT ON readings
+    BEGIN
+        INSERT INTO readings_daily (day, total)
+        VALUES (SUBSTR(NEW.date,1,10), IFNULL(NEW.consumption,0))
+        ON CONFLICT(day) DO UPDATE SET total = IFNULL(total,0) + excluded.total;
+    END""")
+    d.execute("DELETE FROM readings_daily")
+    d.execute("""
+    INSERT INTO readings_daily (day, total)
+    SELECT SUBSTR(date,1,10), TOTAL(consumption)
+    FROM readings
+    GROUP BY SUBSTR(date,1,10)
+    """)
+    # Indexes for the hot WHERE / ORDER BY clauses
+    # (meters.meter_id is already covered by its UNIQUE constraint)
+    # id breaks ties between readings stamped in the same minute, so pages
+    # of /readings neither repeat nor skip rows
+    d.execute("DROP INDEX IF EXISTS idx_readings_date")
+    d.execute("CREATE INDEX IF NOT EXISTS idx_readings_date_id ON readings(date DESC, id DESC)")
+    d.execute("CREATE INDEX IF NOT EXISTS idx_readings_meter_id ON readings(meter_id, id DESC)")
+    d.execute("CREATE INDEX IF NOT EXISTS idx_alerts_status ON alerts(status, id DESC)")
+    d.execute("CREATE INDEX IF NOT EXISTS idx_alerts_reading_id ON alerts(reading_id)")
+    d.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
 
 init_db()
 
-def check_abnormal(meter_id):
-    d = db()
-    try:
-        # Last reading
-        last = d.execute("""
+ALERT_WINDOW = 7        # readings averaged before the new one
+ALERT_THRESHOLD = 30    # percent above that average that raises an alert
+
+INSERT_READING = """
+    INSERT INTO readings
+    (meter_id,opening,closing,consumption,entered_by,employee_id,image)
+    VALUES (?,?,?,?,?,?,?)
+"""
+
+INSERT_ALERT = """
+    INSERT INTO alerts
+    (meter_id, reading_id, consumption, average, percentage, status)
+    VALUES (?,?,?,?,?,?)
+"""
+
+def check_abnormal(d, meter_id, reading_id, today_val):
+    # Runs inside the caller's transaction; the caller commits
+    # Average of last 7 readings before this one: a bounded walk of
+    # idx_readings_meter_id (no sort). Measured faster than the equivalent
+    # AVG() OVER (... ROWS BETWEEN 1 FOLLOWING AND 7 FOLLOWING) form.
+    avg_row = d.execute("""
+        SELECT AVG(consumption) AS avg FROM (
             SELECT consumption FROM readings
-            WHERE meter_id=?
-            ORDER BY id DESC LIMIT 1
-        """, (meter_id,)).fetchone()
-
-        if not last: return
-
-        today_val = last[0]
-
-        # Average of last 7 readings (excluding today)
-        avg_row = d.execute("""
-            SELECT AVG(consumption) FROM (
-                SELECT consumption FROM readings
-                WHERE meter_id=?
-                ORDER BY id DESC LIMIT 7 OFFSET 1
-            )
-        """, (meter_id,)).fetchone()
-
-        avg = avg_row[0] if avg_row and avg_row[0] is not None else 0
-
-        if avg <= 0: return
-
-        percent = ((today_val - avg) / avg) * 100
-
-        if percent >= 30:   # Threshold
-            d.execute("""
-                INSERT INTO alerts
-                (meter_id, date, consumption, average, percentage, status)
-                VALUES (?,?,?,?,?,?)
-            """, (
-                meter_id,
-                datetime.now().strftime("%Y-%m-%d %H:%M"),
-                today_val,
-                round(avg, 2),
-                round(percent, 2),
-                "OPEN"
-            ))
-            d.commit()
-    finally:
-        d.close()
+            WHERE meter_id=? AND id < ?
+            ORDER BY id DESC LIMIT ?
+        )
+    """, (meter_id, reading_id, ALERT_WINDOW)).fetchone()
+
+    avg = avg_row["avg"] if avg_row and avg_row["avg"] is not None else 0
+
+    if avg <= 0: return
+
+    percent = ((today_val - avg) / avg) * 100
+
+    if percent >= ALERT_THRESHOLD:
+        d.execute(INSERT_ALERT, (
+            meter_id,
+            reading_id,
+            today_val,
+            round(avg, 2),
+            round(percent, 2),
+            "OPEN"
+        ))
+
+def recompute_alerts(d):
+    # Batch form of check_abnormal over every reading: one SELECT, vectorised
+    # trailing averages per meter, one executemany. Readings that already
+    # have an alert are skipped.
+    rows = d.execute(
+        "SELECT id, meter_id, date, consumption FROM readings ORDER BY meter_id, id"
+    ).fetchall()
+    n = len(rows)
+    if not n:
+        return 0
+
+    meter_ids = np.array([r["meter_id"] for r in rows], dtype=object)
+    values = np.fromiter((r["consumption"] for r in rows), dtype=np.float64, count=n)
+
+    # Position of each reading within its meter's run
+    starts = np.flatnonzero(np.r_[True, meter_ids[1:] != meter_ids[:-1]])
+    pos = np.arange(n) - np.repeat(starts, np.diff(np.r_[starts, n]))
+
+    # Sum/count of up to ALERT_WINDOW previous readings of the same meter.
+    # NULL consumption arrives as NaN; like SQL AVG() it keeps its slot in
+    # the window but is left out of the sum and the count.
+    prev_sum = np.zeros(n)
+    prev_cnt = np.zeros(n)
+    for lag in range(1, ALERT_WINDOW + 1):
+        ok = (pos[lag:] >= lag) & ~np.isnan(values[:-lag])
+        prev_sum[lag:] += np.where(ok, values[:-lag], 0.0)
+        prev_cnt[lag:] += ok
+
+    avg = np.divide(prev_sum, prev_cnt, out=np.zeros(n), where=prev_cnt > 0)
+    percent = np.divide((values - avg) * 100, avg, out=np.zeros(n), where=avg > 0)
+    hits = np.flatnonzero((avg > 0) & (percent >= ALERT_THRESHOLD))
+
+    new_alerts = [
+        (r["meter_id"], r["id"], r["date"], r["consumption"], a, p, "OPEN", r["id"])
+        for r, a, p in zip((rows[i] for i in hits),
+                           np.round(avg[hits], 2).tolist(),
+                           np.round(percent[hits], 2).tolist())
+    ]
+    before = d.total_changes
+    d.executemany("""
+        INSERT INTO alerts
+        (meter_id, reading_id, date, consumption, average, percentage, status)
+        SELECT ?,?,?,?,?,?,?
+        WHERE NOT EXISTS (SELECT 1 FROM alerts WHERE reading_id=?)
+    """, new_alerts)
+    return d.total_changes - before
+
+@app.cli.command("recompute-alerts")
+def recompute_alerts_command():
+    """Re-run the abnormal consumption check over all stored readings."""
+    d = db()
+    d.execute("BEGIN IMMEDIATE")
+    added = recompute_alerts(d)
+    d.commit()
+    click.echo(f"{added} alert(s) added")
 
 # ---------- HOME ----------
+# Dashboard context is cached per process for a short TTL so refresh storms
+# hit SQLite once; every write view drops it via invalidate_home_cache()
+HOME_CACHE_TTL = 30
+_home_cache = {}
+
+def invalidate_home_cache():
+    _home_cache.clear()
+
 @app.route("/")
 def home():
-    d = db()
+    today = datetime.now().strftime("%Y-%m-%d")
+    cached = _home_cache.get(today)
+    if cached and time.monotonic() - cached[0] < HOME_CACHE_TTL:
+        return render_template("home.html", **cached[1])
+
+    d = db_ro()
     recent_alerts = d.execute("""
-    SELECT * FROM alerts
+    SELECT id, meter_id, date, percentage, status FROM alerts
     WHERE status!='CLOSED'
     ORDER BY id DESC LIMIT 5
 """).fetchall()
-    try:
-        # Get count of open alerts first
-        open_alerts = d.execute(
-            "SELECT COUNT(*) FROM alerts WHERE status='OPEN'"
-        ).fetchone()[0]
-
-        # KPI DATA
-        total_meters = d.execute("SELECT COUNT(*) FROM meters").fetchone()[0]
-        total_readings = d.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
-
-        today = datetime.now().strftime("%Y-%m-%d")
-        month = datetime.now().strftime("%Y-%m")
-
-        today_consumption = d.execute(
-            "SELECT IFNULL(SUM(consumption),0) FROM readings WHERE date LIKE ?",
-            (today+"%",)
-        ).fetchone()[0]
-
-        month_consumption = d.execute(
-            "SELECT IFNULL(SUM(consumption),0) FROM readings WHERE date LIKE ?",
-            (month+"%",)
-        ).fetchone()[0]
-
-        # DAILY GRAPH (LAST 7 DAYS)
-        daily = d.execute("""
-            SELECT SUBSTR(date,1,10), SUM(consumption)
-            FROM readings
-            GROUP BY SUBSTR(date,1,10)
-            ORDER BY SUBSTR(date,1,10) DESC
-            LIMIT 7
-        """).fetchall()
-
-        daily.reverse()
-        daily_labels = [r[0] for r in daily]
-        daily_values = [round(r[1], 2) for r in daily]
-
-        # MONTHLY GRAPH
-        monthly = d.execute("""
-            SELECT SUBSTR(date,1,7), SUM(consumption)
-            FROM readings
-            WHERE date LIKE ?
-            GROUP BY SUBSTR(date,1,7)
-        """, (month+"%",)).fetchall()
-
-        month_labels = [r[0] for r in monthly]
-        month_values = [round(r[1], 2) for r in monthly]
-
-        return render_template(
-            "home.html",
-            open_alerts=open_alerts,
-            total_meters=total_meters,
-            total_readings=total_readings,
-            today_consumption=round(today_consumption, 2),
-            month_consumption=round(month_consumption, 2),
-            daily_labels=json.dumps(daily_labels),
-            daily_values=json.dumps(daily_values),
-            month_labels=json.dumps(month_labels),
-            month_values=json.dumps(month_values)
-        )
-    finally:
-        d.close()
+    # Half-open ISO ranges so the date index can seek instead of scanning
+    now = datetime.now()
+    tomorrow = (now + timedelta(days=1)).strftime("%Y-%m-%d")
+    week_start = (now - timedelta(days=6)).strftime("%Y-%m-%d")
+    month_start = now.strftime("%Y-%m-01")
+    month_end = (now.replace(day=28) + timedelta(days=4)).strftime("%Y-%m-01")
+
+    # KPI DATA - all scalars in one statement, one pass over this month's readings
+    (open_alerts, total_meters, total_readings,
+     today_consumption, month_consumption) = d.execute("""
+        SELECT
+            (SELECT COUNT(*) FROM alerts WHERE status='OPEN'),
+            (SELECT COUNT(*) FROM meters),
+            (SELECT COUNT(*) FROM readings),
+            IFNULL(SUM(CASE WHEN date >= ? AND date < ? THEN consumption END),0),
+            IFNULL(SUM(consumption),0)
+        FROM readings
+        WHERE date >= ? AND date < ?
+    """, (today, tomorrow, month_start, month_end)).fetchone()
+
+    # DAILY GRAPH (LAST 7 DAYS)
+    daily = d.execute("""
+        SELECT day, total
+        FROM readings_daily
+        WHERE day >= ?
+        ORDER BY day DESC
+        LIMIT 7
+    """, (week_start,)).fetchall()
+
+    daily.reverse()
+    daily_labels = [r["day"] for r in daily]
+    daily_values = np.round(np.fromiter((r["total"] for r in daily), dtype=np.float64, count=len(daily)), 2).tolist()
+
+    # MONTHLY GRAPH
+    monthly = d.execute("""
+        SELECT SUBSTR(date,1,7) AS month, SUM(consumption) AS total
+        FROM readings
+        WHERE date >= ? AND date < ?
+        GROUP BY SUBSTR(date,1,7)
+    """, (month_start, month_end)).fetchall()
+
+    month_labels = [r["month"] for r in monthly]
+    month_values = np.round(np.fromiter((r["total"] for r in monthly), dtype=np.float64, count=len(monthly)), 2).tolist()
+
+    context = dict(
+        recent_alerts=recent_alerts,
+        open_alerts=open_alerts,
+        total_meters=total_meters,
+        total_readings=total_readings,
+        today_consumption=round(today_consumption, 2),
+        month_consumption=round(month_consumption, 2),
+        daily_labels=orjson.dumps(daily_labels).decode(),
+        daily_values=orjson.dumps(daily_values).decode(),
+        month_labels=orjson.dumps(month_labels).decode(),
+        month_values=orjson.dumps(month_values).decode()
+    )
+    # Keyed by day so the cache never serves yesterday's totals after midnight
+    _home_cache.clear()
+    _home_cache[today] = (time.monotonic(), context)
+    return render_template("home.html", **context)
 
 # ---------- ADD METER ----------
 @app.route("/add_meter", methods=["GET","POST"])
 def add_meter():
     if request.method == "POST":
         d = db()
-        try:
-            d.execute("""
-            INSERT INTO meters (meter_id, load_type, location, unit)
-            VALUES (?,?,?,?)
-            """, (
-                request.form["meter_id"],
-                request.form["load_type"],
-                request.form["location"],
-                request.form["unit"]
-            ))
-            d.commit()
-        finally:
-            d.close()
+        d.execute("""
+        INSERT INTO meters (meter_id, load_type, location, unit)
+        VALUES (?,?,?,?)
+        """, (
+            request.form["meter_id"],
+            request.form["load_type"],
+            request.form["location"],
+            request.form["unit"]
+        ))
+        invalidate_home_cache()
         return redirect("/meters")
     return render_template("add_meter.html")
 
 # ---------- METER LIST ----------
 @app.route("/meters")
 def meters():
-    d = db()
-    try:
-        rows = d.execute("SELECT * FROM meters").fetchall()
-    finally:
-        d.close()
+    d = db_ro()
+    rows = d.execute("SELECT meter_id, load_type, location, unit FROM meters").fetchall()
     return render_template("meters.html", meters=rows)
 
+# ---------- LOOKUP CACHES ----------
+# The reading form asks for the meter list on every visit. Meters are only
+# ever inserted, so the cached list is reused while MAX(id) is unchanged; that
+# one rowid lookup also sees meters added through any other worker. The
+# opening value is not cached: another worker's stale copy would pre-fill a
+# wrong opening.
+_meters_cache = {}
+
+def meter_list():
+    d = db_ro()
+    last_id = d.execute("SELECT MAX(id) FROM meters").fetchone()[0]
+    cached = _meters_cache.get("all")
+    if cached and cached[0] == last_id:
+        return cached[1]
+    rows = d.execute("SELECT meter_id FROM meters").fetchall()
+    _meters_cache["all"] = (last_id, rows)
+    return rows
+
 # ---------- FETCH OPENING ----------
 @app.route("/get_opening/<meter_id>")
 def get_opening(meter_id):
-    d = db()
-    try:
-        last = d.execute(
-            "SELECT closing FROM readings WHERE meter_id=? ORDER BY id DESC LIMIT 1",
-            (meter_id,)
-        ).fetchone()
-    finally:
-        d.close()
-    return jsonify({"opening": last[0] if last else 0})
+    d = db_ro()
+    last = d.execute(
+        "SELECT closing FROM readings WHERE meter_id=? ORDER BY id DESC LIMIT 1",
+        (meter_id,)
+    ).fetchone()
+    return jsonify({"opening": last["closing"] if last else 0})
 
 # ---------- ADD READING ----------
 @app.route("/add_reading", methods=["GET","POST"])
 def add_reading():
-    d = db()
-    try:
-        meters_list = d.execute("SELECT meter_id FROM meters").fetchall()
-
-        if request.method == "POST":
-            opening = float(request.form["opening"])
-            closing = float(request.form["closing"])
-            consumption = closing - opening
-
-            image = None
-            f = request.files.get("image")
-            if f and f.filename:
-                # Use secure_filename properly
-                ext = os.path.splitext(f.filename)[1]
-                image = secure_filename(f"{request.form['meter_id']}_{datetime.now().strftime('%Y%m%d%H%M%S')}{ext}")
-                f.save(os.path.join(app.config["UPLOAD_FOLDER"], image))
-
-            d.execute("""
-            INSERT INTO readings
-            (meter_id,date,opening,closing,consumption,entered_by,employee_id,image)
-            VALUES (?,?,?,?,?,?,?,?)
-            """, (
-                request.form["meter_id"],
-                datetime.now().strftime("%Y-%m-%d %H:%M"),
-                opening, closing, consumption,
-                request.form["entered_by"],
-                request.form["employee_id"],
-                image
-            ))
-            d.commit()
-            check_abnormal(request.form["meter_id"])
-            return redirect("/readings")
-    finally:
-        d.close()
+    if request.method == "POST":
+        d = db()
+        opening = float(request.form["opening"])
+        closing = float(request.form["closing"])
+        # float() also accepts nan/inf, which SQLite cannot total
+        if not (math.isfinite(opening) and math.isfinite(closing)):
+            return render_template("add_reading.html", meters=meter_list(),
+                                   error="Opening and closing must be finite numbers"), 400
+        consumption = closing - opening
+
+        image = None
+        f = request.files.get("image")
+        if f and f.filename:
+            # Name the file by its SHA-256 so the URL is immutable and a
+            # re-submitted photo is stored only once
+            ext = os.path.splitext(secure_filename(f.filename))[1].lower()
+            h = hashlib.sha256()
+            for chunk in iter(lambda: f.stream.read(1 << 20), b""):
+                h.update(chunk)
+            f.stream.seek(0)
+            image = h.hexdigest() + ext
+            # The name is a hex digest plus secure_filename()'s extension, so
+            # it cannot leave the upload folder
+            folder = app.config["UPLOAD_FOLDER"]
+            path = os.path.join(folder, image)
+            if not os.path.exists(path):
+                # Copy in 1 MB chunks to a temp file in the same folder, then
+                # rename it into place so a failed copy never leaves a
+                # truncated photo under the final name
+                fd, tmp = tempfile.mkstemp(dir=folder, suffix=".part")
+                try:
+                    with os.fdopen(fd, "wb", buffering=0) as dest:
+                        shutil.copyfileobj(f.stream, dest, 1 << 20)
+                    os.chmod(tmp, 0o644)
+                    os.replace(tmp, path)
+                except BaseException:
+                    os.unlink(tmp)
+                    raise
+
+        # Reading and any alert it raises commit together in one transaction
+        d.execute("BEGIN IMMEDIATE")
+        cur = d.execute(INSERT_READING, (
+            request.form["meter_id"],
+            opening, closing, consumption,
+            request.form["entered_by"],
+            request.form["employee_id"],
+            image
+        ))
+        check_abnormal(d, request.form["meter_id"], cur.lastrowid, consumption)
+        d.commit()
+        invalidate_home_cache()
+        return redirect("/readings")
+
+    return render_template("add_reading.html", meters=meter_list())
+
+# ---------- BULK UPLOAD READINGS ----------
+UPLOAD_COLUMNS = ["meter_id", "date", "opening", "closing", "entered_by", "employee_id"]
+
+# A blank CSV date (NULL) falls back to the same stamp as the column default
+UPLOAD_READING = """
+    INSERT INTO readings
+    (meter_id,date,opening,closing,consumption,entered_by,employee_id)
+    VALUES (?,COALESCE(?,strftime('%Y-%m-%d %H:%M','now','localtime')),?,?,?,?,?)
+"""
+
+def parse_reading_date(value):
+    # Stored dates must stay "YYYY-MM-DD HH:MM" for the range queries to work
+    value = (value or "").strip()
+    if not value:
+        return None
+    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).strftime("%Y-%m-%d %H:%M")
+        except ValueError:
+            pass
+    raise ValueError(value)
 
-    return render_template("add_reading.html", meters=meters_list)
+@app.route("/upload_readings", methods=["GET","POST"])
+def upload_readings():
+    def fail(msg):
+        return render_template("upload_readings.html", columns=UPLOAD_COLUMNS, error=msg), 400
+
+    if request.method == "POST":
+        f = request.files.get("file")
+        if not f or not f.filename:
+            return fail("Choose a CSV file to upload")
+
+        d = db()
+        known_meters = {r["meter_id"] for r in d.execute("SELECT meter_id FROM meters")}
+
+        rows = []
+        reader = csv.DictReader(io.TextIOWrapper(f.stream, encoding="utf-8-sig", newline=""))
+        try:
+            for line_no, rec in enumerate(reader, 2):
+                meter_id = (rec.get("meter_id") or "").strip()
+                if meter_id not in known_meters:
+                    return fail(f"Line {line_no}: unknown meter '{meter_id}'")
+                try:
+                    opening = float(rec["opening"])
+                    closing = float(rec["closing"])
+                except (KeyError, TypeError, ValueError):
+                    return fail(f"Line {line_no}: opening and closing must be numbers")
+                # float() also accepts nan/inf, which SQLite cannot total
+                if not (math.isfinite(opening) and math.isfinite(closing)):
+                    return fail(f"Line {line_no}: opening and closing must be finite numbers")
+                try:
+                    date = parse_reading_date(rec.get("date"))
+                except ValueError:
+                    return fail(f"Line {line_no}: date must be YYYY-MM-DD or YYYY-MM-DD HH:MM")
+                rows.append((
+                    meter_id, date,
+                    opening, closing, closing - opening,
+                    rec.get("entered_by") or "",
+                    rec.get("employee_id") or ""
+                ))
+        except (UnicodeDecodeError, csv.Error):
+            return fail("File must be a UTF-8 CSV")
+
+        # One transaction for the whole file, then let the WAL drain
+        d.execute("BEGIN IMMEDIATE")
+        d.executemany(UPLOAD_READING, rows)
+        d.commit()
+        d.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        invalidate_home_cache()
+        return redirect("/readings")
+
+    return render_template("upload_readings.html", columns=UPLOAD_COLUMNS)
 
 # ---------- ALL READINGS ----------
+READINGS_PAGE_SIZE = 50
+
+READINGS_COLUMNS = "id, meter_id, date, opening, closing, consumption"
+
+def _reading_cursor(name):
+    # Cursors are reading ids (SQLite rowids); anything else means no cursor
+    value = request.args.get(name, type=int)
+    return value if value is not None and 0 < value < 1 << 63 else None
+
 @app.route("/readings")
 def readings():
-    d = db()
-    try:
-        rows = d.execute("SELECT * FROM readings ORDER BY date DESC").fetchall()
-    finally:
-        d.close()
-    return render_template("readings.html", rows=rows)
+    # Keyset pagination over idx_readings_date_id: ?before=<id> lists the
+    # readings older than that one, ?after=<id> the ones newer, so every page
+    # is a bounded index walk however deep it is. One extra row tells us
+    # whether there is another page in that direction.
+    d = db_ro()
+    limit = READINGS_PAGE_SIZE + 1
+
+    def page(rows, has_newer, has_older):
+        return render_template(
+            "readings.html",
+            rows=rows,
+            newer=rows[0]["id"] if has_newer else None,
+            older=rows[-1]["id"] if has_older else None
+        )
+
+    after = _reading_cursor("after")
+    if after is not None:
+        rows = d.execute(
+            f"SELECT {READINGS_COLUMNS} FROM readings "
+            "WHERE (date, id) > (SELECT date, id FROM readings WHERE id=?) "
+            "ORDER BY date, id LIMIT ?",
+            (after, limit)
+        ).fetchall()
+        if len(rows) > READINGS_PAGE_SIZE:
+            return page(rows[READINGS_PAGE_SIZE - 1::-1], True, True)
+        # Otherwise these are the newest readings: show the first page
+
+    before = _reading_cursor("before")
+    if before is not None:
+        rows = d.execute(
+            f"SELECT {READINGS_COLUMNS} FROM readings "
+            "WHERE (date, id) < (SELECT date, id FROM readings WHERE id=?) "
+            "ORDER BY date DESC, id DESC LIMIT ?",
+            (before, limit)
+        ).fetchall()
+        if rows:
+            return page(rows[:READINGS_PAGE_SIZE], True, len(rows) > READINGS_PAGE_SIZE)
+
+    rows = d.execute(
+        f"SELECT {READINGS_COLUMNS} FROM readings "
+        "ORDER BY date DESC, id DESC LIMIT ?",
+        (limit,)
+    ).fetchall()
+    return page(rows[:READINGS_PAGE_SIZE], False, len(rows) > READINGS_PAGE_SIZE)
 
 # ---------- METER DETAIL ----------
 @app.route("/meter/<meter_id>")
 def meter_detail(meter_id):
-    d = db()
-    try:
-        alerts = d.execute("""
-            SELECT * FROM alerts
-            WHERE meter_id=? AND status='OPEN'
-        """, (meter_id,)).fetchall()
-        meter = d.execute("SELECT * FROM meters WHERE meter_id=?", (meter_id,)).fetchone()
-        readings_list = d.execute(
-            "SELECT * FROM readings WHERE meter_id=? ORDER BY date DESC",
-            (meter_id,)
-        ).fetchall()
-    finally:
-        d.close()
+    d = db_ro()
+    alerts = d.execute("""
+        SELECT id, date, consumption, average, percentage, status FROM alerts
+        WHERE meter_id=? AND status='OPEN'
+    """, (meter_id,)).fetchall()
+    meter = d.execute(
+        "SELECT meter_id, load_type, location, unit FROM meters WHERE meter_id=?",
+        (meter_id,)
+    ).fetchone()
+    readings_list = d.execute(
+        "SELECT date, opening, closing, consumption, image "
+        "FROM readings WHERE meter_id=? ORDER BY date DESC",
+        (meter_id,)
+    ).fetchall()
     return render_template("meter_detail.html", meter=meter, readings=readings_list, alerts=alerts)
 
+# ---------- EXPORT ----------
+def xlsx_from_cursor(cur, filename):
+    # constant_memory streams each row to a temp file as it is written, so
+    # only the finished (zipped) workbook is held in memory
+    output = io.BytesIO()
+    wb = xlsxwriter.Workbook(output, {"constant_memory": True})
+    ws = wb.add_worksheet()
+    ws.write_row(0, 0, [col[0] for col in cur.description])
+    for i, row in enumerate(cur, 1):
+        ws.write_row(i, 0, row)
+    wb.close()
+    output.seek(0)
+    return send_file(output, as_attachment=True, download_name=filename)
+
 # ---------- EXPORT PER METER ----------
 @app.route("/export/meter/<meter_id>")
 def export_meter(meter_id):
-    with db() as d:
-        df = pd.read_sql(
-            "SELECT date, opening, closing, consumption, entered_by, employee_id "
-            "FROM readings WHERE meter_id=? ORDER BY date",
-            d, params=(meter_id,)
-        )
-    file_path = f"{meter_id}_history.xlsx"
-    df.to_excel(file_path, index=False)
-    return send_file(file_path, as_attachment=True)
+    d = db_ro()
+    cur = d.execute(
+        "SELECT date, opening, closing, consumption, entered_by, employee_id "
+        "FROM readings WHERE meter_id=? ORDER BY date",
+        (meter_id,)
+    )
+    return xlsx_from_cursor(cur, f"{meter_id}_history.xlsx")
 
 # ---------- EXPORT ALL ----------
 @app.route("/export_all")
 def export_all():
-    with db() as d:
-        df = pd.read_sql("SELECT * FROM readings", d)
-    file_path = "all_meter_readings.xlsx"
-    df.to_excel(file_path, index=False)
-    return send_file(file_path, as_attachment=True)
+    d = db_ro()
+    cur = d.execute(
+        "SELECT id, meter_id, date, opening, closing, consumption, entered_by, employee_id, image "
+        "FROM readings"
+    )
+    return xlsx_from_cursor(cur, "all_meter_readings.xlsx")
+
 # ---------- ACKNOWLEDGE ALERT ----------
 @app.route("/alert/ack/<int:alert_id>")
 def acknowledge_alert(alert_id):
@@ -313,13 +733,10 @@ def acknowledge_alert(alert_id):
         UPDATE alerts
         SET status='ACKNOWLEDGED',
             acknowledged_by='Operator',
-            acknowledged_at=?
+            acknowledged_at=strftime('%Y-%m-%d %H:%M','now','localtime')
         WHERE id=?
-    """, (
-        datetime.now().strftime("%Y-%m-%d %H:%M"),
-        alert_id
-    ))
-    d.commit()
+    """, (alert_id,))
+    invalidate_home_cache()
     return redirect(request.referrer or "/")
 
 # ---------- CLOSE ALERT ----------
@@ -330,13 +747,10 @@ def close_alert(alert_id):
         UPDATE alerts
         SET status='CLOSED',
             closed_by='Operator',
-            closed_at=?
+            closed_at=strftime('%Y-%m-%d %H:%M','now','localtime')
         WHERE id=?
-    """, (
-        datetime.now().strftime("%Y-%m-%d %H:%M"),
-        alert_id
-    ))
-    d.commit()
+    """, (alert_id,))
+    invalidate_home_cache()
     return redirect(request.referrer or "/")    
 
 if __name__ == "__main__":
@@ -0,0 +1,29 @@
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def import_app(tmp_path, monkeypatch):
+    # app.py opens power.db and static/uploads relative to the working
+    # directory at import time, so import a fresh copy inside tmp_path
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(ROOT))
+
+    def load():
+        sys.modules.pop("app", None)
+        return importlib.import_module("app")
+
+    yield load
+    sys.modules.pop("app", None)
+
+
+@pytest.fixture
+def app(import_app):
+    mod = import_app()
+    with mod.app.app_context():
+        yield mod
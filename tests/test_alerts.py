@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+
+def add_reading(app, d, meter_id, consumption, date="2026-10-01 10:00"):
+    # Same steps as the add_reading view, with a fixed timestamp
+    d.execute("BEGIN IMMEDIATE")
+    cur = d.execute(
+        "INSERT INTO readings (meter_id, date, opening, closing, consumption) "
+        "VALUES (?,?,?,?,?)",
+        (meter_id, date, 0, consumption, consumption),
+    )
+    if consumption is not None:
+        app.check_abnormal(d, meter_id, cur.lastrowid, consumption)
+    d.commit()
+    return cur.lastrowid
+
+
+def alerts(d):
+    return {
+        r["reading_id"]: (r["meter_id"], r["consumption"], r["average"], r["percentage"])
+        for r in d.execute("SELECT * FROM alerts")
+    }
+
+
+def test_recompute_matches_check_abnormal(app):
+    d = app.db()
+    rng = random.Random(7)
+    for _ in range(600):
+        meter_id = rng.choice(["M1", "M2", "M3", "M4"])
+        # Some NULL consumption, as left by older uploads
+        value = None if rng.random() < 0.1 else round(rng.uniform(1, 100), 2)
+        add_reading(app, d, meter_id, value)
+    expected = alerts(d)
+    assert expected
+
+    d.execute("DELETE FROM alerts")
+    d.execute("BEGIN IMMEDIATE")
+    assert app.recompute_alerts(d) == len(expected)
+    d.commit()
+    got = alerts(d)
+    assert got.keys() == expected.keys()
+    for reading_id, (meter_id, consumption, average, percentage) in expected.items():
+        # SQL and NumPy sum in a different order, so a .xx5 tie may round
+        # either way
+        assert got[reading_id][:2] == (meter_id, consumption)
+        assert got[reading_id][2:] == pytest.approx((average, percentage), abs=0.015)
+
+
+def test_recompute_ignores_null_in_window(app):
+    d = app.db()
+    for value in (10, None, 10, 10, 20):
+        last = add_reading(app, d, "M1", value)
+    assert list(alerts(d)) == [last]
+
+    d.execute("DELETE FROM alerts")
+    d.execute("BEGIN IMMEDIATE")
+    assert app.recompute_alerts(d) == 1
+    d.commit()
+    assert alerts(d)[last] == ("M1", 20, 10, 100)
+
+
+def test_recompute_skips_readings_with_alerts(app):
+    d = app.db()
+    # Same meter, same minute: each abnormal reading keeps its own alert
+    for value in (10, 10, 10, 50, 90):
+        add_reading(app, d, "M1", value)
+    assert len(alerts(d)) == 2
+
+    d.execute("BEGIN IMMEDIATE")
+    assert app.recompute_alerts(d) == 0
+    d.commit()
+
+    d.execute("DELETE FROM alerts WHERE id = (SELECT MIN(id) FROM alerts)")
+    d.execute("BEGIN IMMEDIATE")
+    assert app.recompute_alerts(d) == 1
+    d.commit()
+    assert len(alerts(d)) == 2
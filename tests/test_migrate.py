@@ -0,0 +1,115 @@
+import os
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Tables as created by the first release of app.py
+BASELINE_SCHEMA = """
+CREATE TABLE alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    meter_id TEXT,
+    date TEXT,
+    consumption REAL,
+    average REAL,
+    percentage REAL,
+    status TEXT
+);
+CREATE TABLE meters(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    meter_id TEXT UNIQUE,
+    load_type TEXT,
+    location TEXT,
+    unit TEXT
+);
+CREATE TABLE readings(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    meter_id TEXT,
+    date TEXT,
+    opening REAL,
+    closing REAL,
+    consumption REAL,
+    entered_by TEXT,
+    employee_id TEXT,
+    image TEXT
+);
+"""
+
+
+def make_baseline(path, extra_readings=0):
+    c = sqlite3.connect(path)
+    c.executescript(BASELINE_SCHEMA)
+    c.execute("INSERT INTO meters (meter_id, load_type, location, unit) VALUES ('M1','LT','A','KWH')")
+    c.executemany(
+        "INSERT INTO readings (meter_id, date, opening, closing, consumption, entered_by, employee_id, image) "
+        "VALUES (?,?,?,?,?,?,?,?)",
+        [("M1", "2026-01-01 09:00", 0, 10, 10, "ann", "7", None),
+         ("M1", "2026-01-01 17:59", 10, 20, 10, "ann", "7", "old.jpg"),
+         ("M1", "2026-01-02 08:00", 20, 50, 30, "bob", "8", None)]
+        + [("M1", "2025-06-01 00:00", 0, 1, 1, "", "", None)] * extra_readings,
+    )
+    # The old code stamped this alert a minute after its reading
+    c.execute("INSERT INTO alerts (meter_id, date, consumption, average, percentage, status) "
+              "VALUES ('M1','2026-01-02 08:01',30,10,200,'OPEN')")
+    c.commit()
+    c.close()
+
+
+def test_upgrade_baseline_database(import_app, tmp_path):
+    make_baseline(tmp_path / "power.db")
+    app = import_app()
+
+    c = sqlite3.connect(tmp_path / "power.db")
+    assert c.execute("PRAGMA user_version").fetchone()[0] == app.SCHEMA_VERSION
+    assert c.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert c.execute("SELECT id, date, consumption, image FROM readings ORDER BY id").fetchall() == [
+        (1, "2026-01-01 09:00", 10, None),
+        (2, "2026-01-01 17:59", 10, "old.jpg"),
+        (3, "2026-01-02 08:00", 30, None),
+    ]
+    assert c.execute("SELECT id, status, reading_id, acknowledged_by FROM alerts").fetchall() == [
+        (1, "OPEN", 3, None),
+    ]
+    assert c.execute("SELECT day, total FROM readings_daily ORDER BY day").fetchall() == [
+        ("2026-01-01", 20), ("2026-01-02", 30),
+    ]
+    names = {r[0] for r in c.execute("SELECT name FROM sqlite_master WHERE type IN ('index','trigger')")}
+    assert {"trg_readings_ai", "idx_readings_date_id", "idx_readings_meter_id",
+            "idx_alerts_status", "idx_alerts_reading_id"} <= names
+
+    # Dates now default in SQLite and the rollup follows new readings
+    c.execute("INSERT INTO readings (meter_id, consumption) VALUES ('M1', 5)")
+    c.commit()
+    assert c.execute("SELECT date FROM readings WHERE id = 4").fetchone()[0] is not None
+    assert c.execute("SELECT SUM(total) FROM readings_daily").fetchone()[0] == 55
+    # AUTOINCREMENT counters survive the table rebuild
+    assert c.execute("SELECT seq FROM sqlite_sequence WHERE name = 'readings'").fetchone()[0] == 4
+
+
+def test_current_database_skips_migration(import_app, tmp_path):
+    app = import_app()
+    statements = []
+    c = app._open("c")
+    c.set_trace_callback(statements.append)
+    app._upgrade(c)
+    assert statements == ["PRAGMA user_version"]
+
+
+def test_concurrent_workers_migrate_once(tmp_path):
+    # Workers booting together must queue on the migration, not crash
+    make_baseline(tmp_path / "power.db", extra_readings=20000)
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    workers = [
+        subprocess.Popen([sys.executable, "-c", "import app"], cwd=tmp_path, env=env,
+                         stderr=subprocess.PIPE)
+        for _ in range(4)
+    ]
+    for w in workers:
+        _, err = w.communicate(timeout=120)
+        assert w.returncode == 0, err.decode()
+
+    c = sqlite3.connect(tmp_path / "power.db")
+    assert c.execute("SELECT COUNT(*) FROM readings").fetchone()[0] == 20003
+    assert c.execute("SELECT SUM(total) FROM readings_daily").fetchone()[0] == 20050
@@ -0,0 +1,66 @@
+import io
+import re
+
+import pytest
+
+
+@pytest.fixture
+def client(app):
+    client = app.app.test_client()
+    client.post("/add_meter", data={"meter_id": "M1", "load_type": "LT", "location": "A", "unit": "KWH"})
+    return client
+
+
+def upload(client, data, filename="readings.csv"):
+    return client.post("/upload_readings", data={"file": (io.BytesIO(data), filename)},
+                       content_type="multipart/form-data")
+
+
+def readings(app):
+    return app.db().execute(
+        "SELECT meter_id, date, opening, closing, consumption, entered_by, employee_id "
+        "FROM readings ORDER BY id"
+    ).fetchall()
+
+
+def test_upload_inserts_rows(app, client):
+    data = (
+        "\ufeffmeter_id,date,opening,closing,entered_by,employee_id\n"
+        "M1,2026-01-02 10:30,60,70,ann,7\n"
+        "M1,2026-01-03,70,75,,\n"
+        "M1,,75,76.5,,\n"
+    ).encode("utf-8")
+    r = upload(client, data)
+    assert r.status_code == 302
+
+    rows = [tuple(r) for r in readings(app)]
+    assert rows[0] == ("M1", "2026-01-02 10:30", 60, 70, 10, "ann", "7")
+    assert rows[1] == ("M1", "2026-01-03 00:00", 70, 75, 5, "", "")
+    # A blank date falls back to the upload time
+    assert re.fullmatch(r"\d{4}-\d\d-\d\d \d\d:\d\d", rows[2][1])
+    assert rows[2][4] == 1.5
+    daily = dict(app.db().execute("SELECT day, total FROM readings_daily").fetchall())
+    assert daily["2026-01-02"] == 10 and daily["2026-01-03"] == 5
+
+
+@pytest.mark.parametrize("data, message", [
+    (b"meter_id,opening,closing\nM1,1,2\nZZ,1,2\n", b"Line 3: unknown meter"),
+    (b"meter_id,opening,closing\nM1,one,2\n", b"Line 2: opening and closing must be numbers"),
+    (b"meter_id,opening\nM1,1\n", b"Line 2: opening and closing must be numbers"),
+    (b"meter_id,opening,closing\nM1,nan,2\n", b"Line 2: opening and closing must be finite"),
+    (b"meter_id,opening,closing\nM1,1,inf\n", b"Line 2: opening and closing must be finite"),
+    (b"meter_id,opening,closing,date\nM1,1,2,13/01/2026\n", b"Line 2: date must be"),
+    ("meter_id,opening,closing\nM1,1,2\n".encode("utf-16"), b"File must be a UTF-8 CSV"),
+    (b"meter_id,opening,closing\nM1,1,2\nM1,\xff,3\n", b"File must be a UTF-8 CSV"),
+])
+def test_upload_rejects_whole_file(app, client, data, message):
+    r = upload(client, data)
+    assert r.status_code == 400
+    assert message in r.data
+    assert readings(app) == []
+
+
+def test_upload_requires_file(client):
+    r = client.post("/upload_readings", data={}, content_type="multipart/form-data")
+    assert r.status_code == 400
+    assert b"Choose a CSV file" in r.data
@@ -0,0 +1,9 @@
+# Production entrypoint:
+#   gunicorn -k gevent -w 4 --worker-connections 200 wsgi:app
+# Patch before app is imported so socket I/O becomes cooperative. SQLite
+# calls still block the worker while they run; connections come from a
+# per-process pool in app.py, not per-greenlet storage.
+from gevent import monkey
+monkey.patch_all()
+
+from app import app  # noqa: E402